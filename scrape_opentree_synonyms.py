@@ -2,11 +2,23 @@ from __future__ import annotations
 
 import csv
 import sys
-import time
-from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import requests
+import httpx
+
+from scraper_common import (
+    RateLimiter,
+    cache_get_many,
+    cache_put_many,
+    column_positions,
+    decode_json,
+    make_client,
+    open_cache,
+    padded_rows,
+    rewrite_csv,
+    send_with_retries,
+)
 
 INPUT_PATH = Path("ndm_foods.csv")
 OUTPUT_PATH = INPUT_PATH  # overwrite in place once synonyms are populated
@@ -18,11 +30,18 @@ REQUEST_HEADERS = {"User-Agent": USER_AGENT}
 REQUEST_TIMEOUT = 30
 THROTTLE_SECONDS = 0.15
 CHUNK_SIZE = 40
+MAX_WORKERS = 8
+
+# namespace for this scraper's rows in the shared response cache
+CACHE_API = "opentree_match"
 
 OPEN_TREE_FIELD = "synonyms_open_tree_of_life"
 WIKI_FIELD = "synonyms_wiki_search"
 NCBI_FIELD = "synonyms_ncbi"
 
+CLIENT = make_client(REQUEST_HEADERS, REQUEST_TIMEOUT)
+REQUEST_LIMITER = RateLimiter(THROTTLE_SECONDS)
+
 
 def format_scientific_name(name: str) -> str:
     return name.replace("_", " ").strip()
@@ -47,12 +66,12 @@ def select_best_match(matches: list[dict]) -> dict | None:
 
 def fetch_synonyms_batch(names: list[str]) -> dict[str, list[str]]:
     payload = {"names": names, "include_synonyms": True}
-    response = requests.post(
-        MATCH_URL, json=payload, headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT
+    response = send_with_retries(
+        CLIENT, REQUEST_LIMITER, "POST", MATCH_URL, json=payload
     )
     response.raise_for_status()
 
-    data = response.json()
+    data = decode_json(response.content)
     results = data.get("results", [])
     synonyms_map: dict[str, list[str]] = {}
 
@@ -66,64 +85,73 @@ def fetch_synonyms_batch(names: list[str]) -> dict[str, list[str]]:
         if best_match:
             taxon = best_match.get("taxon", {})
             synonyms = taxon.get("synonyms") or []
-            synonyms_map[name] = list(OrderedDict.fromkeys(synonyms))
+            synonyms_map[name] = list(dict.fromkeys(synonyms))
         else:
             synonyms_map[name] = []
 
     return synonyms_map
 
 
+def try_fetch_synonyms_batch(names: list[str]) -> dict[str, list[str]] | None:
+    try:
+        return fetch_synonyms_batch(names)
+    # ValueError is an undecodable body; skip the batch like a transport error
+    except (httpx.HTTPError, ValueError) as exc:
+        print(
+            f"WARNING: Failed to fetch synonyms for batch starting with {names[0]}: {exc}",
+            file=sys.stderr,
+        )
+        return None
+
+
 def main() -> None:
     if not INPUT_PATH.exists():
         raise SystemExit(f"Input CSV not found: {INPUT_PATH}")
 
     with INPUT_PATH.open(encoding="utf-8", newline="") as handle:
-        reader = csv.DictReader(handle)
-        if reader.fieldnames is None:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
             raise ValueError("CSV missing headers")
 
-        index_field = reader.fieldnames[0]
-        rows = list(reader)
-
-    formatted_names = [
-        format_scientific_name(row.get("food_sci", "")) for row in rows
+        index_field = header[0]
+        (sci_pos,) = column_positions(header, ["food_sci"])
+        formatted_names = {
+            format_scientific_name(row[sci_pos])
+            for row in padded_rows(reader, len(header))
+        }
+
+    formatted_names.discard("")
+    unique_names = sorted(formatted_names)
+
+    cache = open_cache()
+    cached_synonyms = cache_get_many(cache, CACHE_API, unique_names)
+    synonyms_cache: dict[str, str] = {
+        name: "; ".join(synonyms) for name, synonyms in cached_synonyms.items()
+    }
+    missing_names = [name for name in unique_names if name not in cached_synonyms]
+
+    batches = [
+        missing_names[start : start + CHUNK_SIZE]
+        for start in range(0, len(missing_names), CHUNK_SIZE)
     ]
-    unique_names = sorted({name for name in formatted_names if name})
-
-    synonyms_cache: dict[str, str] = {}
-
-    for start in range(0, len(unique_names), CHUNK_SIZE):
-        batch = unique_names[start : start + CHUNK_SIZE]
-        try:
-            batch_synonyms = fetch_synonyms_batch(batch)
-        except requests.RequestException as exc:
-            print(
-                f"WARNING: Failed to fetch synonyms for batch starting with {batch[0]}: {exc}",
-                file=sys.stderr,
-            )
-            batch_synonyms = {name: [] for name in batch}
-
-        for name, synonyms in batch_synonyms.items():
-            synonyms_cache[name] = "; ".join(synonyms)
-
-        time.sleep(THROTTLE_SECONDS)
-
-    updated_rows: list[dict[str, str]] = []
-
-    for row, formatted_name in zip(rows, formatted_names):
-        scientific_raw = row.get("food_sci", "")
-        synonyms_otol = synonyms_cache.get(formatted_name, "") if formatted_name else ""
-
-        updated_rows.append(
-            {
-                index_field: row.get(index_field, ""),
-                "food_com": row.get("food_com", ""),
-                "food_sci": scientific_raw,
-                OPEN_TREE_FIELD: synonyms_otol,
-                WIKI_FIELD: row.get(WIKI_FIELD, ""),
-                NCBI_FIELD: row.get(NCBI_FIELD, ""),
-            }
-        )
+
+    # batches are independent, so keep several requests in flight at once;
+    # executor.map yields results in submission order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for batch, batch_synonyms in zip(
+            batches, executor.map(try_fetch_synonyms_batch, batches)
+        ):
+            if batch_synonyms is None:
+                # leave failed batches out of the disk cache so the next run retries them
+                batch_synonyms = {name: [] for name in batch}
+            else:
+                cache_put_many(cache, CACHE_API, batch_synonyms)
+
+            for name, synonyms in batch_synonyms.items():
+                synonyms_cache[name] = "; ".join(synonyms)
+
+    cache.close()
 
     fieldnames = [
         index_field,
@@ -134,10 +162,21 @@ def main() -> None:
         NCBI_FIELD,
     ]
 
-    with OUTPUT_PATH.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
-        writer.writeheader()
-        writer.writerows(updated_rows)
+    lookup_synonyms = synonyms_cache.get
+
+    def build_row(_idx: int, fields: tuple[str, ...]) -> tuple[str, ...]:
+        index_raw, common_raw, scientific_raw, wiki_raw, ncbi_raw = fields
+        # "" is never a cache key, so blank names fall through to the default
+        synonyms_otol = lookup_synonyms(format_scientific_name(scientific_raw), "")
+        return (index_raw, common_raw, scientific_raw, synonyms_otol, wiki_raw, ncbi_raw)
+
+    rewrite_csv(
+        INPUT_PATH,
+        OUTPUT_PATH,
+        fieldnames,
+        [index_field, "food_com", "food_sci", WIKI_FIELD, NCBI_FIELD],
+        build_row,
+    )
 
 
 if __name__ == "__main__":
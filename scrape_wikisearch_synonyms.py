@@ -1,12 +1,29 @@
 from __future__ import annotations
 
 import csv
-import time
-from collections import OrderedDict
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-import requests
+import httpx
+
+from scraper_common import (
+    CACHE_PATH,
+    RateLimiter,
+    cache_get_many,
+    cache_put_many,
+    column_positions,
+    decode_json,
+    make_client,
+    open_cache,
+    padded_rows,
+    rewrite_csv,
+    send_with_retries,
+)
 
 INPUT_PATH = Path("ndm_foods.csv")
 OUTPUT_PATH = INPUT_PATH
@@ -20,8 +37,20 @@ REQUEST_TIMEOUT = 25
 SEARCH_LIMIT = 5
 ENTITY_CHUNK_SIZE = 40
 TITLE_CHUNK_SIZE = 40
-THROTTLE_SECONDS = 0.02
+# minimum spacing between request starts across all workers (at most 5/s);
+# roughly the pace of the old serial loop, one request per round trip
+THROTTLE_SECONDS = 0.2
+MAX_WORKERS = 8
+# wbgetentities by QID returns the heaviest payloads, so keep fewer in flight
+ENTITY_MAX_WORKERS = 4
 PROGRESS_PREFIX = "[wiki]"
+# trailing "sp", "sp.", "spp" or "spp." marking an unspecified species of a genus
+SPECIES_SUFFIX_RE = re.compile(r"\s+spp?\.?$", re.IGNORECASE)
+
+# namespaces for this scraper's rows in the shared response cache
+SEARCH_CACHE_API = "wikidata_search"
+ENTITY_CACHE_API = "wikidata_entity"
+TITLE_CACHE_API = "wikidata_title"
 
 OPEN_TREE_FIELD = "synonyms_open_tree_of_life"
 WIKI_FIELD = "synonyms_wiki_search"
@@ -36,12 +65,11 @@ def format_common_name(name: str) -> str:
     return name.replace("_", " ").strip()
 
 
-def build_key(scientific: str, common: str, fallback_index: int) -> Tuple[str, str]:
-    sci = format_scientific_name(scientific)
+# build_key and candidate_queries expect names already run through format_*_name
+def build_key(sci: str, com: str, fallback_index: int) -> Tuple[str, str]:
     if sci:
         return ("sci", sci)
 
-    com = format_common_name(common)
     if com:
         return ("com", com)
 
@@ -49,30 +77,34 @@ def build_key(scientific: str, common: str, fallback_index: int) -> Tuple[str, s
     return ("row", str(fallback_index))
 
 
-def candidate_queries(scientific: str, common: str) -> List[str]:
+# taxonomy lists repeat (food_sci, food_com) pairs, so memoize per pair; the
+# result is a tuple so cached values can be shared safely
+@lru_cache(maxsize=None)
+def candidate_queries(sci: str, com: str) -> Tuple[str, ...]:
     candidates: List[str] = []
-    sci = format_scientific_name(scientific)
-    com = format_common_name(common)
 
     if sci:
         candidates.append(sci)
         if sci.endswith("."):
             candidates.append(sci[:-1])
-        lower = sci.lower()
-        if lower.endswith(" sp.") or lower.endswith(" sp") or lower.endswith(" spp.") or lower.endswith(" spp"):
-            candidates.append(sci.rsplit(" ", 1)[0])
+        genus = SPECIES_SUFFIX_RE.sub("", sci)
+        if genus != sci:
+            candidates.append(genus)
 
     if com:
         candidates.append(com)
 
     # Deduplicate while preserving order
-    return list(OrderedDict.fromkeys([c for c in candidates if c]))
+    return tuple(dict.fromkeys(c for c in candidates if c))
 
 
-SESSION = requests.Session()
+# all endpoints live on www.wikidata.org, so the worker pool's requests are
+# multiplexed on one connection
+CLIENT = make_client(REQUEST_HEADERS, REQUEST_TIMEOUT)
+REQUEST_LIMITER = RateLimiter(THROTTLE_SECONDS)
 
 
-def search_entity_id(query: str) -> Optional[str]:
+def fetch_search_results(query: str) -> Optional[List[dict]]:
     params = {
         "action": "wbsearchentities",
         "format": "json",
@@ -82,16 +114,19 @@ def search_entity_id(query: str) -> Optional[str]:
     }
 
     try:
-        response = SESSION.get(
-            SEARCH_URL, params=params, headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT
+        response = send_with_retries(
+            CLIENT, REQUEST_LIMITER, "GET", SEARCH_URL, params=params
         )
         response.raise_for_status()
-    except requests.RequestException as exc:
+        data = decode_json(response.content)
+    except (httpx.HTTPError, ValueError) as exc:
         print(f"WARNING: Wikidata search failed for '{query}': {exc}")
         return None
 
-    data = response.json()
-    results = data.get("search", [])
+    return data.get("search", [])
+
+
+def best_search_match(query: str, results: List[dict]) -> Optional[str]:
     if not results:
         return None
 
@@ -114,181 +149,250 @@ def search_entity_id(query: str) -> Optional[str]:
     return results[0]["id"]
 
 
-def fetch_entities(qids: Iterable[str]) -> Dict[str, dict]:
-    qids_list = [qid for qid in qids if qid]
-    entities: Dict[str, dict] = {}
+def fetch_entity_batch(batch: List[str]) -> Dict[str, dict]:
+    params = {
+        "action": "wbgetentities",
+        "format": "json",
+        "ids": "|".join(batch),
+        "props": "labels|aliases|claims",
+        "languages": "en",
+    }
+
+    try:
+        response = send_with_retries(
+            CLIENT, REQUEST_LIMITER, "GET", ENTITY_URL, params=params
+        )
+        response.raise_for_status()
+        data = decode_json(response.content)
+    except (httpx.HTTPError, ValueError) as exc:
+        print(f"WARNING: Failed fetching entities {batch[0]}...: {exc}")
+        return {}
 
-    for start in range(0, len(qids_list), ENTITY_CHUNK_SIZE):
-        batch = qids_list[start : start + ENTITY_CHUNK_SIZE]
-        params = {
-            "action": "wbgetentities",
-            "format": "json",
-            "ids": "|".join(batch),
-            "props": "labels|aliases|claims",
-            "languages": "en",
-        }
+    return data.get("entities", {})
 
-        try:
-            response = SESSION.get(
-                ENTITY_URL, params=params, headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT
-            )
-            response.raise_for_status()
-        except requests.RequestException as exc:
-            print(f"WARNING: Failed fetching entities {batch[0]}...: {exc}")
-            continue
 
-        data = response.json()
-        entities.update(data.get("entities", {}))
-        time.sleep(THROTTLE_SECONDS)
+def fetch_entities(qids: Iterable[str], cache: sqlite3.Connection) -> Dict[str, dict]:
+    qids_list = list(dict.fromkeys(qid for qid in qids if qid))
+    entities: Dict[str, dict] = cache_get_many(cache, ENTITY_CACHE_API, qids_list)
+    missing_qids = [qid for qid in qids_list if qid not in entities]
+    if not missing_qids:
+        return entities
+
+    batches = [
+        missing_qids[start : start + ENTITY_CHUNK_SIZE]
+        for start in range(0, len(missing_qids), ENTITY_CHUNK_SIZE)
+    ]
+
+    with ThreadPoolExecutor(max_workers=ENTITY_MAX_WORKERS) as executor:
+        for batch_entities in executor.map(fetch_entity_batch, batches):
+            cache_put_many(cache, ENTITY_CACHE_API, batch_entities)
+            entities.update(batch_entities)
 
     return entities
 
 
-def parse_normalized_map(normalized: Optional[dict]) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
-    if normalized is None:
-        return mapping
-    if isinstance(normalized, list):
-        for item in normalized:
-            if isinstance(item, dict) and "from" in item and "to" in item:
-                mapping[item["from"]] = item["to"]
-    elif isinstance(normalized, dict):
-        for item in normalized.values():
-            if isinstance(item, dict) and "from" in item and "to" in item:
-                mapping[item["from"]] = item["to"]
-    return mapping
+def fetch_title_batch(batch: List[str]) -> Optional[dict]:
+    params = {
+        "action": "wbgetentities",
+        "format": "json",
+        "sites": "enwiki",
+        "titles": "|".join(batch),
+        "props": "aliases|claims|sitelinks",
+        "languages": "en",
+    }
+
+    try:
+        response = send_with_retries(
+            CLIENT, REQUEST_LIMITER, "GET", ENTITY_URL, params=params
+        )
+        response.raise_for_status()
+        return decode_json(response.content)
+    except (httpx.HTTPError, ValueError) as exc:
+        print(f"WARNING: Failed fetching titles batch starting {batch[0]}: {exc}")
+        return None
+
+
+def fetch_single_title(title: str) -> Optional[dict]:
+    params = {
+        "action": "wbgetentities",
+        "format": "json",
+        "sites": "enwiki",
+        "titles": title,
+        "props": "aliases|claims|sitelinks",
+        "languages": "en",
+        "normalize": "true",
+    }
+
+    try:
+        response = send_with_retries(
+            CLIENT, REQUEST_LIMITER, "GET", ENTITY_URL, params=params
+        )
+        response.raise_for_status()
+        return decode_json(response.content)
+    except (httpx.HTTPError, ValueError) as exc:
+        # ValueError covers a non-JSON body; treat it like any failed lookup
+        print(f"WARNING: Failed to resolve title {title}: {exc}")
+        return None
+
+
+def normalize_title(title: str) -> str:
+    # enwiki titles treat "_" and " " alike and always start upper-case
+    title = title.strip().replace(" ", "_")
+    return title[:1].upper() + title[1:]
+
+
+def index_entities_by_title(data: dict) -> Tuple[Dict[str, Tuple[str, dict]], List[str]]:
+    title_entity_map: Dict[str, Tuple[str, dict]] = {}
+    missing_titles: List[str] = []
+    for entity_id, entity in data.get("entities", {}).items():
+        if entity.get("missing") == "":
+            title = entity.get("title")
+            if title:
+                missing_titles.append(title)
+            continue
+        enwiki = entity.get("sitelinks", {}).get("enwiki", {})
+        underscore_title = (enwiki.get("title") or "").replace(" ", "_")
+        if underscore_title:
+            title_entity_map[underscore_title] = (entity_id, entity)
+    return title_entity_map, missing_titles
+
+
+def first_enwiki_entity(data: dict) -> Optional[Tuple[str, dict]]:
+    for entity_id, item in data.get("entities", {}).items():
+        if item.get("missing") == "":
+            continue
+        enwiki = item.get("sitelinks", {}).get("enwiki", {})
+        if enwiki.get("title"):
+            return entity_id, item
+    return None
 
 
 def fetch_entities_for_titles(
-    title_to_keys: Dict[str, List[Tuple[str, str]]]
+    title_to_keys: Dict[str, List[Tuple[str, str]]],
+    cache: sqlite3.Connection,
 ) -> Tuple[
     Dict[Tuple[str, str], dict],
     Dict[Tuple[str, str], str],
     Dict[str, dict],
     Set[Tuple[str, str]],
 ]:
-    titles = list(title_to_keys.keys())
     key_to_entity: Dict[Tuple[str, str], dict] = {}
     key_to_qid: Dict[Tuple[str, str], str] = {}
     qid_to_entity: Dict[str, dict] = {}
     unmatched: Set[Tuple[str, str]] = set()
     unresolved_titles: Set[str] = set()
 
-    if not titles:
+    if not title_to_keys:
         return key_to_entity, key_to_qid, qid_to_entity, unmatched
 
-    total_batches = (len(titles) + TITLE_CHUNK_SIZE - 1) // TITLE_CHUNK_SIZE
-
-    for start in range(0, len(titles), TITLE_CHUNK_SIZE):
-        batch = titles[start : start + TITLE_CHUNK_SIZE]
-        batch_index = start // TITLE_CHUNK_SIZE + 1
+    # title -> (qid, entity), or None once a lookup has definitively come up empty;
+    # JSON stores the pairs as lists, so turn cached ones back into tuples
+    title_results: Dict[str, Optional[Tuple[str, dict]]] = {
+        title: tuple(result) if result else None
+        for title, result in cache_get_many(
+            cache, TITLE_CACHE_API, title_to_keys.keys()
+        ).items()
+    }
+    fetched_results: Dict[str, Optional[Tuple[str, dict]]] = {}
+    titles = [title for title in title_to_keys if title not in title_results]
+    if title_results:
         print(
-            f"{PROGRESS_PREFIX} fetching title batch {batch_index}/{total_batches} "
-            f"({len(batch)} titles)",
+            f"{PROGRESS_PREFIX} {len(title_results)} titles served from {CACHE_PATH}",
             flush=True,
         )
-        params = {
-            "action": "wbgetentities",
-            "format": "json",
-            "sites": "enwiki",
-            "titles": "|".join(batch),
-            "props": "aliases|claims|sitelinks",
-            "languages": "en",
-        }
-
-        try:
-            response = SESSION.get(
-                ENTITY_URL, params=params, headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT
-            )
-            response.raise_for_status()
-        except requests.RequestException as exc:
-            print(f"WARNING: Failed fetching titles batch starting {batch[0]}: {exc}")
-            unmatched.update([key for title in batch for key in title_to_keys[title]])
-            continue
 
-        data = response.json()
-        title_entity_map: Dict[str, Tuple[str, dict]] = {}
-        for entity_id, entity in data.get("entities", {}).items():
-            if entity.get("missing") == "":
-                title = entity.get("title")
-                if title:
-                    unresolved_titles.add(title)
-                continue
-            enwiki = entity.get("sitelinks", {}).get("enwiki", {})
-            title = enwiki.get("title")
-            if not title:
-                continue
-            underscore_title = title.replace(" ", "_")
-            title_entity_map[underscore_title] = (entity_id, entity)
-            qid_to_entity[entity_id] = entity
-
-        for requested_title in batch:
-            keys = title_to_keys.get(requested_title, [])
-            if requested_title in title_entity_map:
-                qid, entity = title_entity_map[requested_title]
-                for key in keys:
-                    key_to_entity[key] = entity
-                    key_to_qid[key] = qid
-            else:
-                unresolved_titles.add(requested_title)
-
-        time.sleep(THROTTLE_SECONDS)
+    batches = [
+        titles[start : start + TITLE_CHUNK_SIZE]
+        for start in range(0, len(titles), TITLE_CHUNK_SIZE)
+    ]
+    total_batches = len(batches)
 
-    single_title_cache: Dict[str, Tuple[str, dict]] = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        batch_results = executor.map(fetch_title_batch, batches)
+        for batch_index, (batch, data) in enumerate(
+            zip(batches, batch_results), start=1
+        ):
+            print(
+                f"{PROGRESS_PREFIX} fetched title batch {batch_index}/{total_batches} "
+                f"({len(batch)} titles)",
+                flush=True,
+            )
+            if data is None:
+                unmatched.update([key for title in batch for key in title_to_keys[title]])
+                continue
 
-    unresolved_titles = sorted(unresolved_titles)
-    for idx, title in enumerate(unresolved_titles, start=1):
+            title_entity_map, missing_titles = index_entities_by_title(data)
+            unresolved_titles.update(missing_titles)
+            qid_to_entity.update(title_entity_map.values())
+
+            for requested_title in batch:
+                result = title_entity_map.get(requested_title)
+                if result is None:
+                    unresolved_titles.add(requested_title)
+                else:
+                    fetched_results[requested_title] = result
+
+    # Most misses are only a matter of case (e.g. "stachys_affinis"). wbgetentities
+    # honours normalize=true for a single title only, so normalize locally and
+    # retry in full batches; just the residue needs one request per title.
+    retry_titles: Dict[str, List[str]] = {}
+    for title in unresolved_titles:
+        normalized = normalize_title(title)
+        if normalized != title:
+            retry_titles.setdefault(normalized, []).append(title)
+
+    retry_list = list(retry_titles)
+    retry_batches = [
+        retry_list[start : start + TITLE_CHUNK_SIZE]
+        for start in range(0, len(retry_list), TITLE_CHUNK_SIZE)
+    ]
+    if retry_batches:
         print(
-            f"{PROGRESS_PREFIX} resolving leftover title {idx}/{len(unresolved_titles)}: {title}",
+            f"{PROGRESS_PREFIX} retrying {len(retry_titles)} normalized titles "
+            f"in {len(retry_batches)} batches",
             flush=True,
         )
-        if title in single_title_cache:
-            result = single_title_cache[title]
-        else:
-            params = {
-                "action": "wbgetentities",
-                "format": "json",
-                "sites": "enwiki",
-                "titles": title,
-                "props": "aliases|claims|sitelinks",
-                "languages": "en",
-                "normalize": "true",
-            }
-            try:
-                response = SESSION.get(
-                    ENTITY_URL,
-                    params=params,
-                    headers=REQUEST_HEADERS,
-                    timeout=REQUEST_TIMEOUT,
-                )
-                response.raise_for_status()
-                data = response.json()
-            except requests.RequestException as exc:
-                print(f"WARNING: Failed to resolve title {title}: {exc}")
-                data = {}
-
-            entity_data = data.get("entities", {})
-            entity = None
-            qid = None
-            for entity_id, item in entity_data.items():
-                if item.get("missing") == "":
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for batch, data in zip(retry_batches, executor.map(fetch_title_batch, retry_batches)):
+            if data is None:
+                # leave these to the single-title pass below
+                continue
+
+            # the titles were normalized locally and the batch request does not
+            # set normalize=true, so the sitelinks match them as sent
+            title_entity_map, _ = index_entities_by_title(data)
+            for normalized in batch:
+                result = title_entity_map.get(normalized)
+                if result is None:
                     continue
-                enwiki = item.get("sitelinks", {}).get("enwiki", {})
-                if enwiki.get("title"):
-                    entity = item
-                    qid = entity_id
-                    break
-
-            if entity and qid:
-                single_title_cache[title] = (qid, entity)
-            else:
-                single_title_cache[title] = (None, None)
-            time.sleep(THROTTLE_SECONDS)
-            result = single_title_cache[title]
-
-        qid, entity = result
+                qid_to_entity[result[0]] = result[1]
+                for title in retry_titles[normalized]:
+                    fetched_results[title] = result
+                    unresolved_titles.discard(title)
+
+    unresolved_titles = sorted(unresolved_titles)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        leftover_results = executor.map(fetch_single_title, unresolved_titles)
+        for idx, (title, data) in enumerate(
+            zip(unresolved_titles, leftover_results), start=1
+        ):
+            print(
+                f"{PROGRESS_PREFIX} resolved leftover title {idx}/{len(unresolved_titles)}: {title}",
+                flush=True,
+            )
+            if data is None:
+                unmatched.update(title_to_keys.get(title, []))
+                continue
+            fetched_results[title] = first_enwiki_entity(data)
+
+    cache_put_many(cache, TITLE_CACHE_API, fetched_results)
+    title_results.update(fetched_results)
+
+    for title, result in title_results.items():
         keys = title_to_keys.get(title, [])
-        if qid and entity:
+        if result:
+            qid, entity = result
             qid_to_entity[qid] = entity
             for key in keys:
                 key_to_entity[key] = entity
@@ -299,6 +403,55 @@ def fetch_entities_for_titles(
     return key_to_entity, key_to_qid, qid_to_entity, unmatched
 
 
+def search_entity_ids(
+    keys: Iterable[Tuple[str, str]],
+    name_candidates: Dict[Tuple[str, str], Tuple[str, ...]],
+    cache: sqlite3.Connection,
+) -> Dict[Tuple[str, str], str]:
+    # keys is walked twice below, so a one-shot iterator must be materialized
+    keys = list(keys)
+    query_cache: Dict[str, Optional[str]] = cache_get_many(
+        cache,
+        SEARCH_CACHE_API,
+        {query for key in keys for query in name_candidates.get(key, ())},
+    )
+    searched: Dict[str, Optional[str]] = {}
+    key_to_qid: Dict[Tuple[str, str], str] = {}
+
+    # Round n searches the n-th candidate of every key still unresolved, so each
+    # key stops at its first hit exactly as a serial walk would, but all of a
+    # round's queries are in flight together.
+    pending = [key for key in keys if name_candidates.get(key)]
+    depth = 0
+    while pending:
+        queries = [
+            query
+            for query in dict.fromkeys(name_candidates[key][depth] for key in pending)
+            if query not in query_cache
+        ]
+        if queries:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                for query, results in zip(
+                    queries, executor.map(fetch_search_results, queries)
+                ):
+                    query_cache[query] = best_search_match(query, results or [])
+                    if results is not None:
+                        searched[query] = query_cache[query]
+
+        still_pending = []
+        for key in pending:
+            qid = query_cache[name_candidates[key][depth]]
+            if qid:
+                key_to_qid[key] = qid
+            elif depth + 1 < len(name_candidates[key]):
+                still_pending.append(key)
+        pending = still_pending
+        depth += 1
+
+    cache_put_many(cache, SEARCH_CACHE_API, searched)
+    return key_to_qid
+
+
 def extract_aliases(entity: dict) -> List[str]:
     aliases = []
     for alias in entity.get("aliases", {}).get("en", []):
@@ -334,14 +487,14 @@ def english_label(entity: Optional[dict]) -> Optional[str]:
 
 
 def dedupe_preserve_order(values: Iterable[str]) -> List[str]:
-    ordered = OrderedDict()
+    seen: Set[str] = set()
+    ordered: List[str] = []
     for value in values:
         cleaned = value.strip()
-        if not cleaned:
-            continue
-        if cleaned not in ordered:
-            ordered[cleaned] = None
-    return list(ordered.keys())
+        if cleaned and cleaned not in seen:
+            seen.add(cleaned)
+            ordered.append(cleaned)
+    return ordered
 
 
 def main() -> None:
@@ -349,28 +502,33 @@ def main() -> None:
         raise SystemExit(f"Input CSV not found: {INPUT_PATH}")
 
     with INPUT_PATH.open(encoding="utf-8", newline="") as handle:
-        reader = csv.DictReader(handle)
-        if reader.fieldnames is None:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
             raise ValueError("CSV missing headers")
 
-        index_field = reader.fieldnames[0]
-        rows = list(reader)
-
+        index_field = header[0]
+        pick_names = itemgetter(*column_positions(header, ["food_sci", "food_com"]))
+
+        # Map names to candidate queries; rows themselves are re-read when writing
+        name_candidates: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        row_count = 0
+        for idx, row in enumerate(padded_rows(reader, len(header))):
+            scientific_raw, common_raw = pick_names(row)
+            sci_fmt = format_scientific_name(scientific_raw)
+            com_fmt = format_common_name(common_raw)
+            key = build_key(sci_fmt, com_fmt, idx)
+            queries = candidate_queries(sci_fmt, com_fmt)
+            if queries:
+                name_candidates.setdefault(key, queries)
+            row_count += 1
+
+    cache = open_cache()
     print(
-        f"{PROGRESS_PREFIX} loaded {len(rows)} rows from {INPUT_PATH}",
+        f"{PROGRESS_PREFIX} loaded {row_count} rows from {INPUT_PATH}",
         flush=True,
     )
 
-    # Map names to candidate queries
-    name_candidates: Dict[Tuple[str, str], List[str]] = {}
-    for idx, row in enumerate(rows):
-        scientific_raw = row.get("food_sci", "")
-        common_raw = row.get("food_com", "")
-        key = build_key(scientific_raw, common_raw, idx)
-        queries = candidate_queries(scientific_raw, common_raw)
-        if queries:
-            name_candidates.setdefault(key, queries)
-
     title_to_keys: Dict[str, List[Tuple[str, str]]] = {}
     for key, queries in name_candidates.items():
         primary = queries[0]
@@ -385,7 +543,7 @@ def main() -> None:
     )
 
     key_to_entity, key_to_qid, qid_to_entity, unmatched_keys = fetch_entities_for_titles(
-        title_to_keys
+        title_to_keys, cache
     )
 
     if unmatched_keys:
@@ -393,22 +551,9 @@ def main() -> None:
             f"{PROGRESS_PREFIX} falling back to search for {len(unmatched_keys)} keys",
             flush=True,
         )
-        query_cache: Dict[str, Optional[str]] = {}
-        fallback_qids: Dict[Tuple[str, str], str] = {}
-        for key in unmatched_keys:
-            queries = name_candidates.get(key, [])
-            qid: Optional[str] = None
-            for query in queries:
-                if query not in query_cache:
-                    query_cache[query] = search_entity_id(query)
-                    time.sleep(THROTTLE_SECONDS)
-                qid = query_cache[query]
-                if qid:
-                    break
-            if qid:
-                fallback_qids[key] = qid
+        fallback_qids = search_entity_ids(unmatched_keys, name_candidates, cache)
 
-        additional_entities = fetch_entities(fallback_qids.values())
+        additional_entities = fetch_entities(fallback_qids.values(), cache)
         for key, qid in fallback_qids.items():
             entity = additional_entities.get(qid)
             if entity:
@@ -444,53 +589,38 @@ def main() -> None:
             f"{PROGRESS_PREFIX} fetching {len(missing_qids)} synonym-linked entities",
             flush=True,
         )
-        entity_data.update(fetch_entities(missing_qids))
+        entity_data.update(fetch_entities(missing_qids, cache))
+
+    cache.close()
+
+    # resolve each label once instead of once per key that references it
+    qid_to_label: Dict[str, str] = {}
+    for qid, entity in entity_data.items():
+        label = english_label(entity)
+        if label:
+            qid_to_label[qid] = label
 
     key_to_synonyms: Dict[Tuple[str, str], str] = {}
     for key in name_candidates.keys():
         aliases = key_to_aliases.get(key, [])
         synonym_qids = key_to_synonym_qids.get(key, [])
 
-        synonym_labels = [
-            english_label(entity_data.get(qid)) for qid in synonym_qids
-        ]
-        combined = aliases + [label for label in synonym_labels if label]
+        combined = aliases + list(filter(None, map(qid_to_label.get, synonym_qids)))
 
         # remove case-insensitive duplicates and the canonical name itself
-        canonical_lower = key[1].lower()
         filtered: List[str] = []
-        seen_lower: Set[str] = set()
+        seen_lower: Set[str] = {key[1].lower()}
         for item in combined:
             item_clean = item.strip()
             if not item_clean:
                 continue
             item_lower = item_clean.lower()
-            if item_lower == canonical_lower:
-                continue
             if item_lower not in seen_lower:
                 filtered.append(item_clean)
                 seen_lower.add(item_lower)
 
         key_to_synonyms[key] = "; ".join(filtered)
 
-    updated_rows: List[dict] = []
-    for idx, row in enumerate(rows):
-        scientific_raw = row.get("food_sci", "")
-        common_raw = row.get("food_com", "")
-        key = build_key(scientific_raw, common_raw, idx)
-        synonyms_wiki = key_to_synonyms.get(key, "")
-
-        updated_rows.append(
-            {
-                index_field: row.get(index_field, ""),
-                "food_com": row.get("food_com", ""),
-                "food_sci": row.get("food_sci", ""),
-                OPEN_TREE_FIELD: row.get(OPEN_TREE_FIELD, ""),
-                WIKI_FIELD: synonyms_wiki,
-                NCBI_FIELD: row.get(NCBI_FIELD, ""),
-            }
-        )
-
     fieldnames = [
         index_field,
         "food_com",
@@ -500,10 +630,25 @@ def main() -> None:
         NCBI_FIELD,
     ]
 
-    with OUTPUT_PATH.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
-        writer.writeheader()
-        writer.writerows(updated_rows)
+    lookup_synonyms = key_to_synonyms.get
+
+    def build_row(idx: int, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        index_raw, common_raw, scientific_raw, otol_raw, ncbi_raw = fields
+        key = build_key(
+            format_scientific_name(scientific_raw),
+            format_common_name(common_raw),
+            idx,
+        )
+        synonyms_wiki = lookup_synonyms(key, "")
+        return (index_raw, common_raw, scientific_raw, otol_raw, synonyms_wiki, ncbi_raw)
+
+    rewrite_csv(
+        INPUT_PATH,
+        OUTPUT_PATH,
+        fieldnames,
+        [index_field, "food_com", "food_sci", OPEN_TREE_FIELD, NCBI_FIELD],
+        build_row,
+    )
     print(f"{PROGRESS_PREFIX} wrote results to {OUTPUT_PATH}", flush=True)
 
 
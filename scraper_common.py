@@ -0,0 +1,211 @@
+"""Cache, rate-limit and CSV plumbing shared by the synonym scrapers."""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+import httpx
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib parser
+    orjson = None
+
+# one cache file for every scraper; rows are namespaced by the api column
+CACHE_PATH = Path("synonyms_cache.sqlite")
+CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# failed connects, retried inside the httpx transport
+CONNECT_RETRIES = 3
+# whole-request re-sends after a throttle or gateway error, timeout or dropped
+# connection
+REQUEST_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.3
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+def make_client(headers: dict[str, str], timeout: float) -> httpx.Client:
+    # HTTP/2 lets a worker pool's concurrent requests to one host share a single
+    # TLS connection; the transport retries failed connects, and redirects are
+    # followed as requests did
+    return httpx.Client(
+        headers=headers,
+        timeout=timeout,
+        follow_redirects=True,
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=CONNECT_RETRIES,
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+        ),
+    )
+
+
+class RateLimiter:
+    # spaces calls at least min_interval apart across all worker threads
+    def __init__(self, min_interval: float) -> None:
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            slot = max(time.monotonic(), self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        # hold every worker back, e.g. until a server's Retry-After has passed
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def send_with_retries(
+    client: httpx.Client, limiter: RateLimiter, method: str, url: str, **kwargs: Any
+) -> httpx.Response:
+    # every API behind the scrapers is a read-only lookup, so re-sending is
+    # safe; each attempt takes a fresh limiter slot, and the final attempt's
+    # response or transport error is handed to the caller
+    for attempt in range(REQUEST_RETRIES):
+        limiter.wait()
+        delay = RETRY_BACKOFF_SECONDS * 2**attempt
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            pass
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            delay = max(delay, retry_after_seconds(response) or 0.0)
+        # back off the whole pool, not just this worker, so a throttled server
+        # is not hit by the other in-flight workers meanwhile
+        limiter.pause(delay)
+    limiter.wait()
+    return client.request(method, url, **kwargs)
+
+
+def decode_json(content: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def open_cache(path: Path = CACHE_PATH) -> sqlite3.Connection:
+    cache = sqlite3.connect(path)
+    cache.execute("PRAGMA journal_mode=WAL")
+    cache.execute(
+        "CREATE TABLE IF NOT EXISTS kv("
+        "api TEXT, key TEXT, value BLOB, ts REAL, PRIMARY KEY(api, key))"
+    )
+    return cache
+
+
+def cache_get_many(
+    cache: sqlite3.Connection, api: str, keys: Iterable[str]
+) -> dict[str, Any]:
+    cutoff = time.time() - CACHE_TTL_SECONDS
+    found: dict[str, Any] = {}
+    for key in keys:
+        row = cache.execute(
+            "SELECT value FROM kv WHERE api = ? AND key = ? AND ts >= ?",
+            (api, key, cutoff),
+        ).fetchone()
+        if row is not None:
+            found[key] = decode_json(zlib.decompress(row[0]))
+    return found
+
+
+def cache_put_many(cache: sqlite3.Connection, api: str, items: dict[str, Any]) -> None:
+    if not items:
+        return
+    now = time.time()
+    with cache:
+        cache.executemany(
+            "INSERT OR REPLACE INTO kv(api, key, value, ts) VALUES (?, ?, ?, ?)",
+            [
+                (api, key, zlib.compress(json.dumps(value).encode("utf-8")), now)
+                for key, value in items.items()
+            ],
+        )
+
+
+def column_positions(header: list[str], names: list[str]) -> list[int]:
+    # columns missing from the header point one past the end, at the spare
+    # empty cell padded_rows appends to every row
+    positions = {name: idx for idx, name in enumerate(header)}
+    return [positions.get(name, len(header)) for name in names]
+
+
+def padded_rows(rows: Iterable[list[str]], width: int) -> Iterator[list[str]]:
+    # skip blank lines like csv.DictReader did (keeping the fallback row index
+    # stable), and reshape every row to exactly width cells plus one empty
+    # sentinel; cells past the header are dropped so a missing column can
+    # never read a stray extra value
+    for row in rows:
+        if not row:
+            continue
+        if len(row) > width:
+            del row[width:]
+        row.extend([""] * (width + 1 - len(row)))
+        yield row
+
+
+def rewrite_csv(
+    input_path: Path,
+    output_path: Path,
+    fieldnames: list[str],
+    columns: list[str],
+    build_row: Callable[[int, tuple[str, ...]], Iterable[str]],
+) -> None:
+    # stream the input a second time straight into a sibling temp file, so only
+    # the caller's lookups stay resident and output_path may equal input_path;
+    # build_row gets each row's index (blank lines skipped) and its cells for
+    # columns, and returns the output row
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    try:
+        with input_path.open(encoding="utf-8", newline="") as src, tmp_path.open(
+            "w", encoding="utf-8", newline=""
+        ) as dst:
+            reader = csv.reader(src)
+            header = next(reader)
+            writer = csv.writer(dst, quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(fieldnames)
+            # bound once so the per-row calls below are plain local lookups
+            pick_fields = itemgetter(*column_positions(header, columns))
+            writerow = writer.writerow
+
+            for idx, row in enumerate(padded_rows(reader, len(header))):
+                writerow(build_row(idx, pick_fields(row)))
+
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        # don't leave a half-written temp file next to the data, Ctrl-C included
+        tmp_path.unlink(missing_ok=True)
+        raise